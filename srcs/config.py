@@ -95,6 +95,8 @@ mongodb = SimpleNamespace()
 mongodb.host = "127.0.0.1"
 mongodb.port = 27017
 mongodb.timeout = 1000
+# Seconds before cached protocols are read again, to see changes made outside
+mongodb.cache_timeout = 5
 mongodb.database = "awesome-industrial-protocols"
 mongodb.test_database = "test-aip"
 mongodb.id = "_id"
@@ -17,7 +17,7 @@ from abc import ABC, abstractmethod
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 # Internal
-from config import mongodb
+from config import mongodb, protocols as p
 
 #-----------------------------------------------------------------------------#
 # Constants                                                                   #
@@ -128,6 +128,8 @@ class MongoDB():
     port = 0
     timeout = 0
     database = None
+    # Incremented on every write to protocols, kept when the instance is reset
+    protocols_version = 0
 
     # Singleton stuff
     def __new__(cls, *args, **kwargs):
@@ -145,6 +147,11 @@ class MongoDB():
     def reset(cls):
         cls._instance = None
 
+    @classmethod
+    def protocols_changed(cls):
+        """Notify that protocols collection was modified (invalidates caches)."""
+        cls.protocols_version += 1
+
     #-------------------------------------------------------------------------#
     # Properties                                                              #
     #-------------------------------------------------------------------------#
@@ -169,6 +176,11 @@ class MongoDB():
         """Return all protocols in collection."""
         return self.db[mongodb.protocols].find()
 
+    @property
+    def protocols_names(self) -> list:
+        """Return only names and aliases of all protocols in collection."""
+        return list(self.db[mongodb.protocols].find({}, {p.name: 1, p.alias: 1}))
+
     @property
     def links(self):
         """Return links collection."""
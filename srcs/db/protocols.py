@@ -6,9 +6,13 @@
 """Classes that represent and handle protocols' info from the database.
 """
 
+from functools import lru_cache
+from typing import Iterator
+from time import monotonic
+# Internal
 from config import protocols as p, types, mongodb
 from . import MongoDB, DBException, Collection, Document
-from . import search, exact_search
+from . import search, format_for_search, PrefixTree
 
 #-----------------------------------------------------------------------------#
 # Constants                                                                   #
@@ -25,19 +29,81 @@ ERR_INVPACKET = "Field '{0}' only accepts valid packets."
 ERR_MULTIMATCH = "Multiple match found, please choose between {0}."
 ERR_BOOLVALUE = "This field only accept 'true' or 'false'"
 
+#-----------------------------------------------------------------------------#
+# Helpers                                                                     #
+#-----------------------------------------------------------------------------#
+
+# Protocol attributes that are not written to the database
+_NOT_STORED = frozenset((mongodb.obj,))
+_NOT_STORED_ID = _NOT_STORED | {mongodb.id}
+
+# Type of default fields, other fields have no type
+_FIELD_TYPE = {x: p.TYPE(x) for x in p.ALL_FIELDS}
+_LIST_TYPES = (types.LIST, types.LINKLIST, types.PKTLIST)
+
+# Default fields can be abbreviated (ex: "desc" for "description")
+_FIELDS_TREE = PrefixTree(p.ALL_FIELDS)
+
+@lru_cache(maxsize=512)
+def _resolve_field(field: str, fields: tuple) -> tuple:
+    """Return the fields matching field (lowercase).
+
+    Exact names come first, then fields with the same name once formatted
+    (ex: "notes extra" for "Notes Extra"). Default fields starting with field
+    are only used if no field has this name, so that they don't hide custom
+    fields. Returned names are the ones used as attributes.
+    Results are kept in cache as most protocols have the same fields.
+    """
+    if field in fields:
+        return (field,)
+    match = tuple(x for x in fields if search(field, x, threshold=0))
+    if match:
+        return match
+    return tuple(x for x in _FIELDS_TREE.keys(format_for_search(field))
+                 if x in fields)
+
+def _aslist(value: object) -> list:
+    """Return value as a list, empty strings being empty lists."""
+    if isinstance(value, list):
+        return value
+    return [] if value == "" else [value]
+
+def _new_items(oldvalue: object, value: list) -> list:
+    """Return items of value missing from oldvalue, without duplicates."""
+    oldvalue = dict.fromkeys(_aslist(oldvalue))
+    return [x for x in dict.fromkeys(value) if x != '' and x not in oldvalue]
+
+def _copy(protocol: dict) -> dict:
+    """Return a copy of a protocol document that does not share its lists."""
+    return {k: v[:] if isinstance(v, list) else v for k, v in protocol.items()}
+
+def _all_names(name: str, alias: object) -> tuple:
+    """Return the name and aliases of a protocol, without empty ones."""
+    return tuple(x for x in [name] + _aslist(alias) if x != "")
+
 #-----------------------------------------------------------------------------#
 # Protocol class                                                              #
 #-----------------------------------------------------------------------------#
 
 class Protocol(Document):
     """Class representing a single protocol document."""
+    # Fields are instance attributes, not __slots__: new fields can be added
+    # at any time (see add()) and Document instances have a __dict__ anyway.
+    # Use Protocols.iter_objects to avoid holding all protocols in memory.
+    __fields = None # Cache for the list of fields
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        for k, v in kwargs.items():
-            setattr(self, k, v)
+        # Document only sets _db and _id, fields are copied all at once
+        self.__dict__.update(kwargs)
         self.__fill()
 
+    def __setattr__(self, name: str, value: object) -> None:
+        # A new public attribute is a new field: cached fields are outdated
+        if not name.startswith("_") and name not in self.__dict__:
+            self.__fields = None
+        super().__setattr__(name, value)
+
     def __store(self, field: str, value: object) -> None:
         """Save value to the Document in DB and in this class."""
         if isinstance(value, Document):
@@ -45,19 +111,52 @@ class Protocol(Document):
         document = {"name": self.name}
         newvalue = {field: value}
         self._db.protocols.update_one(document, {"$set": newvalue})
+        self._db.protocols_changed()
         setattr(self, field, value)
-        
+
+    def __store_items(self, field: str, oldvalue: list, items: list) -> None:
+        """Add new items to a list field in DB and in this class.
+
+        The database ignores items that the list already contains.
+        """
+        document = {"name": self.name}
+        newvalue = {field: {"$each": items}}
+        result = self._db.protocols.update_one(document, {"$addToSet": newvalue})
+        if not result.matched_count:
+            raise DBException(ERR_UNKPROTO.format(self.name))
+        if not result.modified_count:
+            raise DBException(ERR_EXIVALUE.format(p.NAME(field)))
+        self._db.protocols_changed()
+        setattr(self, field, oldvalue + items)
+
+    def __normalize(self, field: str, value: object) -> object:
+        """Convert value to the format expected by the field's type."""
+        ftype = _FIELD_TYPE.get(field)
+        # We deal with the simplest case first
+        if not ftype or ftype == types.STR:
+            return value
+        # Is the value a link or a packet ?
+        if isinstance(value, Document):
+            value = value._id
+            if ftype == types.LINKLIST and value not in self._db.links_id:
+                raise DBException(ERR_INVLINK.format(p.NAME(field)))
+            elif ftype == types.PKTLIST and value not in self._db.packets_id:
+                raise DBException(ERR_INVPACKET.format(p.NAME(field)))
+        # All other fields are lists (LIST, LINKLIST, PKTLIST)
+        return _aslist(value)
+
     #--- Public --------------------------------------------------------------#
 
     def get(self, field: str) -> tuple:
         """Get the exact name and value associated to field.
 
-        The research is case-insensitive.
+        The research is case-insensitive and default fields can be
+        abbreviated as long as only one of them matches.
 
         :raises DBException: if the field does not exist or if the
         requested fields matches multiple ones.
         """
-        match = search(field, self.fields, threshold=0)
+        match = _resolve_field(field.lower(), self.fields)
         if len(match) == 1:
             return match[0], getattr(self, match[0])
         if len(match) > 1:
@@ -67,81 +166,74 @@ class Protocol(Document):
     def set(self, field: str, value: object, replace: bool = False) -> None:
         """Update existing field in protocol."""
         field, oldvalue = self.get(field)
-        ftype = p.TYPE(field)
-        # We deal with the simplest case first
-        if not ftype or ftype == types.STR:
+        value = self.__normalize(field, value)
+        if replace or _FIELD_TYPE.get(field) not in _LIST_TYPES:
             return self.__store(field, value)
-        # Is the value a link or a packet ?
-        if isinstance(value, Document):
-            value = value._id
-            if ftype == types.LINKLIST and value not in self._db.links_id:
-                raise DBException(ERR_INVLINK.format(p.NAME(field)))
-            elif ftype == types.PKTLIST and value not in self._db.packets_id:
-                raise DBException(ERR_INVPACKET.format(p.NAME(field)))
-        # All other fields are lists (LIST, LINKLIST, PKTLIST)
-        value = value if isinstance(value, list) else [value]
-        if replace:
-            value = value if isinstance(value, list) else [value]
-        elif not replace and oldvalue:
-            oldvalue = oldvalue if isinstance(oldvalue, list) else [oldvalue]
-            if set(oldvalue) & set(value):
+        # Only items that are not already in the list are added
+        items = _new_items(oldvalue, value)
+        if not items:
+            if [x for x in value if x != '']:
                 raise DBException(ERR_EXIVALUE.format(p.NAME(field)))
-            value = [x for x in oldvalue + value if x != '']
-        self.__store(field, value)
+            return None # Nothing to add
+        if isinstance(oldvalue, list):
+            # Items are appended by the database, no need to send the list
+            return self.__store_items(field, oldvalue, items)
+        # Fields stored as a string are converted to lists
+        return self.__store(field, _aslist(oldvalue) + items)
 
     def add(self, field: str, value: object) -> None:
         """Add a new field to protocol."""
-        setattr(self, field, value)
-        self.set(field, value)
+        # The field is new, no need to look for it or for its old value
+        self.__store(field, self.__normalize(field, value))
 
     def append(self, field: str, value: object) -> None:
         """Append a value to the existing value in a field."""
-        _, oldvalue = self.get(field)
-        oldvalue = [oldvalue] if not isinstance(oldvalue, list) else oldvalue
-        if value not in oldvalue:
-            value = [value] if not isinstance(value, list) else value
-            self.set(field, [x for x in oldvalue + value if x != ''])
-        else:
+        field, oldvalue = self.get(field)
+        items = _new_items(oldvalue, _aslist(value))
+        if not items:
             raise DBException(ERR_EXIVALUE.format(p.NAME(field)))
+        if _FIELD_TYPE.get(field) in _LIST_TYPES:
+            # Only new items are sent to the database
+            return self.set(field, items)
+        # Other fields don't append by themselves, the list is rebuilt
+        return self.set(field, _aslist(oldvalue) + items, replace=True)
 
     def check(self):
         """Check visitor."""
         # Check that all mandatory fields are set.
+        fields = self.__dict__
+        if fields.keys() >= p.FIELDS.keys():
+            return
         for attr in p.FIELDS:
-            try:
-                getattr(self, attr)
-            except AttributeError:
-                raise DBException(ERR_MANDFIELD.format(attr, self.name)) from None
+            if attr not in fields:
+                raise DBException(ERR_MANDFIELD.format(attr, self.name))
 
     def to_dict(self, exclude_id: bool = True) -> dict:
         """Convert protocol object's content to dictionary."""
-        pdict = {}
-        for item in self.fields:
-            if exclude_id and item == mongodb.id:
-                continue
-            if item != mongodb.obj:
-                pdict[item] = getattr(self, item)
-        return pdict
+        skip = _NOT_STORED_ID if exclude_id else _NOT_STORED
+        return {k: v for k, v in self.__dict__.items()
+                if not k.startswith("_Protocol_") and k not in skip}
 
     @property
     def names(self) -> list:
         """Return all names, including aliases."""
-        alias = self.alias if isinstance(self.alias, list) \
-            else [self.alias]
-        return [x for x in [self.name] + alias if x != ""]
+        return list(_all_names(self.name, self.alias))
 
     @property
-    def fields(self) -> list:
+    def fields(self) -> tuple:
         """Return fields in protocol object (public class attributes)."""
-        return [x for x in self.__dict__ if not x.startswith("_Protocol_")]
+        if self.__fields is None:
+            self.__fields = tuple(x for x in self.__dict__
+                                  if not x.startswith("_"))
+        return self.__fields
 
     def __fill(self):
         """Check that all mandatory fields are set for protocol objects."""
-        for attr, _ in p.ALL_FIELDS.items():
-            try:
-                getattr(self, attr)
-            except AttributeError:
-                setattr(self, attr, "")
+        fields = self.__dict__
+        if not fields.keys() >= p.ALL_FIELDS.keys():
+            for attr in p.ALL_FIELDS:
+                if attr not in fields:
+                    fields[attr] = ""
         self.check()
 
 #-----------------------------------------------------------------------------#
@@ -153,6 +245,12 @@ class Protocols(Collection):
 
     def __init__(self):
         super().__init__()
+        self._cache = None
+        self._cache_ver = -1
+        self._cache_time = 0
+        self._name_index = {}
+        self._index_ver = -1
+        self._index_time = 0
 
     def get(self, protocol_name: str) -> Protocol:
         """Get a protocol by its name. Returns data as a Protocol object.
@@ -161,57 +259,153 @@ class Protocols(Collection):
 
         :raises DBException: If the protocol does not exist.
         """
-        match = []
-        # We extract from the db everytime even if it's heavy to be up to date
-        for protocol in self.all_as_objects:
-            if exact_search(protocol_name, protocol.names):
-                match = [protocol]
-                break # We found the exact match
-            if search(protocol_name, protocol.names):
-                match.append(protocol)
-        if len(match) == 1:
-            return match[0]
-        if len(match) > 1:
-            match = [x.name for x in match]
-            raise DBException(ERR_MULTIMATCH.format(", ".join(match)))
-        raise DBException(ERR_UNKPROTO.format(protocol_name))
+        protocol_id = self.__find(protocol_name)[mongodb.id]
+        protocol = self._db.protocols.find_one({mongodb.id: protocol_id})
+        if not protocol:
+            raise DBException(ERR_UNKPROTO.format(protocol_name))
+        return Protocol(**protocol)
 
     def add(self, protocol: Protocol) -> None:
         """Add a new protocol."""
         try:
-            proto = self.get(protocol.name)
+            proto = self.__find(protocol.name)
         except DBException:
             pass # The protocol does not exist, we can continue
         else:
-            raise DBException(ERR_EXIPROTO.format(proto.name))
+            raise DBException(ERR_EXIPROTO.format(proto[p.name]))
         self._db.protocols.insert_one(protocol.to_dict())
+        self._db.protocols_changed()
 
     def delete(self, protocol: Protocol) -> None:
         """Delete an existing protocol."""
-        self.get(protocol.name) # Will raise if unknown
+        self.__find(protocol.name) # Will raise if unknown
         self._db.protocols.delete_one({p.name: protocol.name})
+        self._db.protocols_changed()
+
+    def has(self, content: str) -> bool:
+        """Return true if this protocol already exists."""
+        try:
+            self.__find(content)
+        except DBException:
+            return False
+        return True
+
+    def check(self) -> Iterator[str]:
+        """Check that protocols in database have all mandatory fields.
+
+        Only protocols with missing fields are returned by the database.
+        Protocols without a name are identified by their ID.
+        """
+        query = {"$or": [{x: {"$exists": False}} for x in p.FIELDS]}
+        projection = {mongodb.id: 1, **{x: 1 for x in p.FIELDS}}
+        for protocol in self._db.protocols.find(query, projection):
+            name = protocol.get(p.name, protocol[mongodb.id])
+            for attr in p.FIELDS:
+                if attr not in protocol:
+                    yield ERR_MANDFIELD.format(attr, name)
 
     @property
     def all(self) -> list:
-        """Return the list of protocols as JSON."""
-        return self._db.protocols_all
+        """Return the list of protocols as JSON, sorted by name.
+
+        The list is kept in cache and only extracted again from the database
+        when protocols were modified since the last extraction. Changes made
+        outside this process (another instance, mongoimport) are only seen
+        once the cache expires, after mongodb.cache_timeout seconds. A copy is
+        returned so that the cache cannot be modified by callers.
+        """
+        self.__update_cache()
+        return [_copy(x) for x in self._cache]
 
     @property
     def all_as_objects(self) -> list:
-        """Return the list of protocols as Protocol objects.
+        """Return the list of protocols as Protocol objects, sorted by name.
 
-        We choose to rebuild it everytime even though it's slower because
-        we need it to be up to date with the database.
+        Objects are rebuilt everytime so that they can be modified safely.
         """
-        objects = [Protocol(**x) for x in self._db.protocols_all]
-        return sorted(objects, key=lambda x: x.name.lower())
+        return list(self.iter_objects)
+
+    @property
+    def iter_objects(self):
+        """Return protocols as Protocol objects one by one, sorted by name.
+
+        Prefer it to all_as_objects when going through protocols only once:
+        each object is built when it is needed.
+        """
+        self.__update_cache()
+        return (Protocol(**_copy(x)) for x in self._cache)
 
     @property
     def list(self) -> list:
         """Return the list of protocol names."""
-        return [x["name"] for x in self._db.protocols_all]
+        self.__update_cache()
+        return [x["name"] for x in self._cache]
 
     @property
     def count(self) -> int:
         """Return the total number of protocols."""
         return self._db.protocols_count
+
+    #--- Private -------------------------------------------------------------#
+
+    def __expired(self, version: int, since: float) -> bool:
+        """Return true if data cached at this version and time is outdated.
+
+        The version only changes with writes made through this process, so
+        cached data also expires after mongodb.cache_timeout seconds.
+        """
+        return version != self._db.protocols_version or \
+            monotonic() - since > mongodb.cache_timeout
+
+    def __update_cache(self) -> None:
+        """Extract protocols from the database if they changed since last time."""
+        if not self.__expired(self._cache_ver, self._cache_time):
+            return
+        version, since = self._db.protocols_version, monotonic()
+        self._cache = sorted(self._db.protocols_all,
+                             key=lambda x: x[p.name].lower())
+        self._cache_ver, self._cache_time = version, since
+
+    def __find(self, protocol_name: str) -> dict:
+        """Get a protocol's ID, name and aliases by its name.
+
+        Only these fields are read from the database, and matching protocols
+        are not converted to objects, so that callers that only need to know
+        if a protocol exists don't create any.
+
+        :raises DBException: If the protocol does not exist.
+        """
+        self.__update_index()
+        # Exact match on name or alias
+        hit = self._name_index.get(format_for_search(protocol_name))
+        if hit:
+            return hit[0]
+        # Search all names at once
+        match = []
+        for name in search(protocol_name, list(self._name_index)):
+            match += [x for x in self._name_index[name] if x not in match]
+        if len(match) == 1:
+            return match[0]
+        if len(match) > 1:
+            match = [x[p.name] for x in match]
+            raise DBException(ERR_MULTIMATCH.format(", ".join(match)))
+        raise DBException(ERR_UNKPROTO.format(protocol_name))
+
+    def __update_index(self) -> None:
+        """Index protocols' names again if they changed since last time.
+
+        The index associates each name and alias (formatted for search) to
+        the list of protocols using it, in alphabetical order.
+        """
+        if not self.__expired(self._index_ver, self._index_time):
+            return
+        version, since = self._db.protocols_version, monotonic()
+        self._name_index = {}
+        for protocol in sorted(self._db.protocols_names,
+                               key=lambda x: x[p.name].lower()):
+            for name in _all_names(protocol[p.name], protocol.get(p.alias, "")):
+                name = format_for_search(name)
+                protocols = self._name_index.setdefault(name, [])
+                if protocol not in protocols:
+                    protocols.append(protocol)
+        self._index_ver, self._index_time = version, since
@@ -45,17 +45,21 @@ def search(needle: str, haystack: object, threshold: int = LEVENSHTEIN_THRESHOLD
     """Search for needle in haystack (a list or a string).
 
     The function uses the Levenshtein distance and may return several results.
+    The distance is at least the difference of length between both strings,
+    so it is not computed when this difference is above threshold.
     """
     results = []
     needle = format_for_search(needle)
     if isinstance(haystack, str):
         haystack = format_for_search(haystack)
-        if levenshtein(needle, haystack) <= threshold:
+        if abs(len(needle) - len(haystack)) <= threshold and \
+           levenshtein(needle, haystack) <= threshold:
             results.append(needle)
     elif isinstance(haystack, (list, tuple)):
         for entry in haystack:
             entry = format_for_search(entry)
-            if levenshtein(needle, entry) <= threshold:
+            if abs(len(needle) - len(entry)) <= threshold and \
+               levenshtein(needle, entry) <= threshold:
                 results.append(entry)
     return results
 
@@ -68,6 +72,43 @@ def exact_search(needle: str, haystack: object) -> list:
         haystack = [x.lower() for x in haystack]
     return search(needle, haystack, 0)
 
+class PrefixTree():
+    """Character tree used to find all the words starting with a prefix.
+
+    Lookups only depend on the length of the prefix, not on the number of
+    words in the tree.
+    """
+    END = None # Key marking the end of a word in a node
+
+    def __init__(self, words: object = ()):
+        self.root = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        """Add a word to the tree."""
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[self.END] = word
+
+    def keys(self, prefix: str = "") -> list:
+        """Return all words starting with prefix, in alphabetical order."""
+        node = self.root
+        for char in prefix:
+            if char not in node:
+                return []
+            node = node[char]
+        results, nodes = [], [node]
+        while nodes:
+            node = nodes.pop()
+            for char, child in node.items():
+                if char is self.END:
+                    results.append(child)
+                else:
+                    nodes.append(child)
+        return sorted(results)
+
 def has_common_items(list1: str, list2: str) -> bool:
     """Returns true if at least one item for list1 is also in list2."""
     if not list1 or not list2:
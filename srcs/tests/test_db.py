@@ -7,7 +7,7 @@
 import unittest
 from os import system
 
-from db import MongoDB, DBException, ERR_MULTIMATCH
+from db import MongoDB, DBException, ERR_MULTIMATCH, ERR_MANDFIELD, PrefixTree
 from db import Protocols, Protocol, Links, Link, Packets, Packet
 from config import mongodb
 
@@ -203,7 +203,7 @@ class Test03DBProtocolsCollection(DBTest):
         self.assertFalse(self.protocols.has("poulet"))
     def test_0312_checkprotocols(self):
         """An complete protocol passes check()."""
-        self.protocols.check()
+        self.assertEqual(list(self.protocols.check()), [])
     def test_0313_deleteprotocols(self):
         """We can delete an existing protocol."""
         protocol = self.protocols.get(PROTOCOLS[0])
@@ -214,6 +214,51 @@ class Test03DBProtocolsCollection(DBTest):
         """We cannot delete a protocol that does not exist."""
         with self.assertRaises(DBException):
             self.protocols.delete(Protocol(name="pigeon"))
+    def test_0315_getprotocols_set(self):
+        """Changes made with set() are seen by the collection."""
+        self.protocols.all # Fill the cache before the change
+        self.protocols.get(PROTOCOLS[3]).set("description", "Cached")
+        pdict = [x for x in self.protocols.all if x["name"] == PROTOCOLS[3]][0]
+        self.assertEqual(pdict["description"], "Cached")
+        protocol = self.protocols.get(PROTOCOLS[3])
+        self.assertEqual(protocol.description, "Cached")
+    def test_0316_getprotocols_adddelete(self):
+        """Protocols added or deleted are seen by the collection."""
+        self.assertNotIn("Bernarde", self.protocols.list)
+        self.protocols.add(Protocol(name="Bernarde"))
+        self.assertIn("Bernarde", self.protocols.list)
+        self.assertEqual(self.protocols.get("Bernarde").name, "Bernarde")
+        self.protocols.delete(Protocol(name="Bernarde"))
+        self.assertNotIn("Bernarde", self.protocols.list)
+        with self.assertRaises(DBException):
+            self.protocols.get("Bernarde")
+    def test_0317_getprotocols_copy(self):
+        """Modifying a protocol object does not change the collection."""
+        self.protocols.get(PROTOCOLS[2]).set("keywords", ["Gerard"])
+        protocol = [x for x in self.protocols.all_as_objects
+                    if x.name == PROTOCOLS[2]][0]
+        protocol.keywords.append("Lino Ventura")
+        pdict = [x for x in self.protocols.all if x["name"] == PROTOCOLS[2]][0]
+        self.assertNotIn("Lino Ventura", pdict["keywords"])
+        protocol = self.protocols.get(PROTOCOLS[2])
+        self.assertNotIn("Lino Ventura", protocol.keywords)
+    def test_0318_checkprotocols_missing(self):
+        """check() reports protocols missing mandatory fields."""
+        self.db.protocols.insert_one({"name": "Incomplete"})
+        try:
+            issues = list(self.protocols.check())
+        finally:
+            self.db.protocols.delete_one({"name": "Incomplete"})
+        self.assertIn(ERR_MANDFIELD.format("description", "Incomplete"), issues)
+    def test_0319_checkprotocols_noname(self):
+        """check() identifies protocols without a name by their ID."""
+        self.db.protocols.insert_one({"description": "Nameless"})
+        document = self.db.protocols.find_one({"description": "Nameless"})
+        try:
+            issues = list(self.protocols.check())
+        finally:
+            self.db.protocols.delete_one({"description": "Nameless"})
+        self.assertIn(ERR_MANDFIELD.format("name", document["_id"]), issues)
 
 class Test04DBProtocolDocument(DBTest):
     """Test class to get and set data in protocols' collection."""
@@ -340,6 +385,79 @@ class Test04DBProtocolDocument(DBTest):
         link = self.links.get(LINKS[0])
         with self.assertRaises(DBException):
             protocol.set("discovery", link)
+    def test_0421_prefixtree(self):
+        """Prefix tree returns all words starting with a prefix."""
+        tree = PrefixTree(["specs", "security", "scapy", "port"])
+        self.assertEqual(tree.keys("s"), ["scapy", "security", "specs"])
+        self.assertEqual(tree.keys("sp"), ["specs"])
+        self.assertEqual(tree.keys("port"), ["port"])
+        self.assertEqual(tree.keys("x"), [])
+    def test_0422_getprotocol_abbrev(self):
+        """A default field can be abbreviated."""
+        protocol = self.protocols.get(PROTOCOLS[1])
+        self.assertEqual(protocol.get("desc")[0], "description")
+    def test_0423_getprotocol_abbrevmulti(self):
+        """An abbreviation matching several fields is refused."""
+        protocol = self.protocols.get(PROTOCOLS[1])
+        with self.assertRaises(DBException) as cm:
+            protocol.get("p")
+        self.assertEqual(str(cm.exception)[:44], ERR_MULTIMATCH[:44])
+    def test_0424_setprotocol_customfield(self):
+        """A new field can be read and written again with its name."""
+        protocol = self.protocols.get(PROTOCOLS[2])
+        protocol.add("Notes Extra", "content")
+        protocol = self.protocols.get(PROTOCOLS[2])
+        self.assertEqual(protocol.get("Notes Extra"), ("Notes Extra", "content"))
+        protocol.set("notes extra", "other content")
+        protocol = self.protocols.get(PROTOCOLS[2])
+        self.assertEqual(protocol.get("Notes Extra"),
+                         ("Notes Extra", "other content"))
+    def test_0425_appendprotocol_list(self):
+        """Values can be appended to a list field that is not empty."""
+        protocol = self.protocols.get(PROTOCOLS[2])
+        protocol.set("keywords", ["Gerard"], replace=True)
+        protocol.append("keywords", ["Lanvin", "Gerard"])
+        self.assertEqual(protocol.get("keywords")[1], ["Gerard", "Lanvin"])
+        protocol = self.protocols.get(PROTOCOLS[2])
+        self.assertEqual(protocol.get("keywords")[1], ["Gerard", "Lanvin"])
+    def test_0426_appendprotocol_dup(self):
+        """We cannot append values that are already in a list field."""
+        protocol = self.protocols.get(PROTOCOLS[2])
+        with self.assertRaises(DBException):
+            protocol.append("keywords", "Lanvin")
+    def test_0427_getprotocol_customabbrev(self):
+        """A custom field is not hidden by a default field it abbreviates."""
+        protocol = self.protocols.get(PROTOCOLS[3])
+        protocol.add("Desc", "custom")
+        protocol = self.protocols.get(PROTOCOLS[3])
+        self.assertEqual(protocol.get("Desc"), ("Desc", "custom"))
+        self.assertEqual(protocol.get("descr")[0], "description")
+    def test_0428_setprotocol_strlistpartial(self):
+        """New values are added once to list fields, existing ones ignored."""
+        protocol = self.protocols.get(PROTOCOLS[1])
+        protocol.set("alias", "Bob Woodward", replace=True)
+        protocol.set("alias", ["Bob Woodward", "Carl Bernstein", "Carl Bernstein"])
+        expected = ["Bob Woodward", "Carl Bernstein"]
+        self.assertEqual(protocol.get("alias")[1], expected)
+        self.assertEqual(self.protocols.get(PROTOCOLS[1]).alias, expected)
+    def test_0429_setprotocol_strpartial(self):
+        """Fields stored as a string follow the same rules as lists."""
+        protocol = self.protocols.get(PROTOCOLS[3])
+        alias = TEST_COLL_PROTOCOLS[3]["alias"]
+        self.assertEqual(protocol.alias, alias)
+        protocol.set("alias", [alias, "Joanne Woodward"])
+        expected = [alias, "Joanne Woodward"]
+        self.assertEqual(protocol.get("alias")[1], expected)
+        self.assertEqual(self.protocols.get(PROTOCOLS[3]).alias, expected)
+    def test_0430_appendprotocol_str(self):
+        """Appending to a field stored as a string turns it into a list."""
+        protocol = self.protocols.get(PROTOCOLS[2])
+        alias = TEST_COLL_PROTOCOLS[2]["alias"]
+        self.assertEqual(protocol.alias, alias)
+        protocol.append("alias", "Kim Novak")
+        expected = [alias, "Kim Novak"]
+        self.assertEqual(protocol.get("alias")[1], expected)
+        self.assertEqual(self.protocols.get(PROTOCOLS[2]).alias, expected)
 
 class Test05DBLinksCollection(DBTest):
     """Test class to get and set data in links' collection."""
@@ -185,7 +185,7 @@ class CLI(UI):
         # self.search(search)
         searched_fields = p.ALL_FIELDS.keys()
         results = {}
-        for protocol in self.protocols.all_as_objects:
+        for protocol in self.protocols.iter_objects:
             for key in searched_fields:
                 try:
                     _, value = protocol.get(key)
@@ -234,7 +234,7 @@ class CLI(UI):
 
     def __cmd_list(self) -> None:
         """-L / --list"""
-        pdict = {x.name: x.description for x in self.protocols.all_as_objects}
+        pdict = {x.name: x.description for x in self.protocols.iter_objects}
         self.__print_table(pdict, nocap=True)
         # Stats
         print(MSG_PROTO_COUNT.format(self.protocols.count))
@@ -472,7 +472,7 @@ class CLI(UI):
                 md_generator.write_awesome()
                 print(MSG_WRITE_ALIST.format(path))
             # Protocol pages
-            for protocol in self.protocols.all_as_objects:
+            for protocol in self.protocols.iter_objects:
                 path = md_generator.gen_protocol_page(protocol, self.links,
                                                       self.packets, write=False)
                 if exists(path):
@@ -507,7 +507,7 @@ class CLI(UI):
         if not source and not protocol:
             source, protocol = self.options.fetch
         if protocol == "all":
-            for p in self.protocols.all_as_objects:
+            for p in self.protocols.iter_objects:
                 self.__cmd_fetch(source, p)
         else:
             if not isinstance(protocol, Protocol):
@@ -66,7 +66,7 @@ class TUI(UI):
     @property
     def filtered_list(self):
         """List filtered according to the values of search."""
-        return self.__search_list([x.name for x in self.protocols.all_as_objects])
+        return self.__search_list([x.name for x in self.protocols.iter_objects])
 
     # tmp
     def nop(self):
@@ -51,7 +51,7 @@ class UI():
         Returns a dictionary where each entry is {protocol_name: field_content}.
         """
         vdict = {}
-        for protocol in self.protocols.all_as_objects:
+        for protocol in self.protocols.iter_objects:
             try:
                 vdict[protocol.name] = protocol.get(field)[1]
             except DBException:
@@ -66,7 +66,7 @@ class UI():
         """
         sdict = {}
         search = search.lower() # Search is case-insensitive
-        for protocol in self.protocols.all_as_objects:
+        for protocol in self.protocols.iter_objects:
             for key in p.SEARCHED_FIELDS:
                 try: # Check if protocol exists
                     _, value = protocol.get(key)